@@ -1,7 +1,9 @@
 import argparse
 import asyncio
 import collections
+import itertools
 import math
+import re
 import sys
 import urllib
 from dataclasses import dataclass
@@ -113,7 +115,7 @@ class SimpleScheduler:
     async def __aexit__(self, exc_type, exc, tb):
         await self.close()
 
-    async def add_to_frontier(self, url):
+    async def add_to_frontier(self, url, referrer=None):
         if url not in self._seen:
             await self.frontier.put(url)
 
@@ -152,6 +154,127 @@ class SimpleScheduler:
         self.frontier.task_done()
 
 
+class UrlScorer:
+    """Scores URLs for best-first crawling; higher scores are crawled first.
+
+    The score combines depth from the root (shallower is better), the number of
+    in-links seen so far (dampened with log1p), regex `pattern_weights` matched
+    against the URL, and a penalty per query parameter to avoid query-string
+    explosion (calendars, faceted search, deep pagination, etc).
+
+    Any callable with the signature `(url, depth, inlinks) -> float` can be
+    used in its place by the priority schedulers.
+    """
+    def __init__(self, depth_weight=1.0, inlink_weight=1.0,
+                 pattern_weights=None, query_penalty=0.5):
+        self.depth_weight = depth_weight
+        self.inlink_weight = inlink_weight
+        self.pattern_weights = [
+            (re.compile(pattern), weight)
+            for pattern, weight in (pattern_weights or {}).items()]
+        self.query_penalty = query_penalty
+
+    def __call__(self, url, depth, inlinks):
+        query = urllib.parse.urlsplit(url).query
+        num_params = len(urllib.parse.parse_qsl(query, keep_blank_values=True))
+        score = (
+            self.inlink_weight * math.log1p(inlinks)
+            - self.depth_weight * depth
+            - self.query_penalty * num_params)
+        for pattern, weight in self.pattern_weights:
+            if pattern.search(url):
+                score += weight
+        return score
+
+
+class PriorityScheduler(SimpleScheduler):
+    """Best-first variant of `SimpleScheduler`, ordering the frontier by `scorer`
+
+    The frontier is a heap (`asyncio.PriorityQueue`). Score updates, such as
+    when a new in-link is discovered, push a new entry; the superseded entry is
+    lazily discarded when it is popped, and is no longer counted as an
+    unfinished task so that `join` does not wait on it. Ties are broken in
+    discovery order, even after rescoring.
+
+    Since each new in-link pushes another entry, the heap is rebuilt from the
+    live entries once it exceeds `compaction_ratio` times the frontier size;
+    otherwise it would grow with the number of links rather than URLs.
+    """
+    compaction_ratio = 2
+
+    def __init__(self, scorer=None):
+        super().__init__()
+        self.frontier = asyncio.PriorityQueue()
+        self.scorer = scorer if scorer is not None else UrlScorer()
+        self._counter = itertools.count()
+        self._pending = {}  # url -> current score of its live frontier entry
+        self._discovery = {}  # url -> sequence number of first discovery
+        self._depth = {}
+        self._inlinks = collections.Counter()
+
+    async def add_to_frontier(self, url, referrer=None):
+        if url in self._seen:
+            return
+        if url not in self._discovery:
+            self._discovery[url] = next(self._counter)
+        if referrer is None:
+            depth = 0
+        else:
+            depth = self._depth.get(referrer, 0) + 1
+            self._inlinks[url] += 1
+        self._depth[url] = min(depth, self._depth.get(url, depth))
+        score = self.scorer(url, self._depth[url], self._inlinks[url])
+        old_score = self._pending.get(url)
+        if old_score == score:
+            return
+        self._pending[url] = score
+        await self.frontier.put((-score, self._discovery[url], url))
+        if old_score is not None:
+            self.frontier.task_done()
+            if self.frontier.qsize() > self.compaction_ratio * len(self._pending):
+                self._compact()
+
+    def _compact(self):
+        """Rebuild the heap from the live entries in `_pending`"""
+        while True:
+            try:
+                self.frontier.get_nowait()
+            except asyncio.queues.QueueEmpty:
+                break
+        # Put before marking done so the task count never spuriously hits zero
+        for url, score in self._pending.items():
+            self.frontier.put_nowait((-score, self._discovery[url], url))
+        for url in self._pending:
+            self.frontier.task_done()
+
+    async def get(self):
+        while True:
+            neg_score, _, url = await self.frontier.get()
+            if url not in self._seen and self._pending.get(url) == -neg_score:
+                del self._pending[url]
+                self._seen.add(url)
+                # Only depth is still needed, to score the links on this page
+                del self._discovery[url]
+                self._inlinks.pop(url, None)
+                return url
+            # Stale entry superseded by a rescoring; already accounted for
+
+    def qsize(self):
+        return make_future_result(len(self._pending))
+
+    def drain(self):
+        """Drain the frontier"""
+        while True:
+            try:
+                self.frontier.get_nowait()
+            except asyncio.queues.QueueEmpty:
+                break
+        for url in self._pending:
+            self.frontier.task_done()
+        self._pending.clear()
+        return make_future_result(None)
+
+
 # FIXME add TTL, including on seen for real stuff;
 # see https://stackoverflow.com/questions/17060672/ttl-for-a-set-member
 
@@ -197,7 +320,7 @@ class RedisScheduler:
     async def __aexit__(self, exc_type, exc, tb):
         await self.close()
 
-    async def add_to_frontier(self, url):
+    async def add_to_frontier(self, url, referrer=None):
         await self.redis.lpush("frontier", url.encode("utf-8"))
 
     async def join(self):
@@ -243,6 +366,148 @@ class RedisScheduler:
         pass
 
 
+class RedisPriorityScheduler(RedisScheduler):
+    """Best-first variant of `RedisScheduler`, ordering the frontier by `scorer`
+
+    The frontier is a sorted set, so rescoring a URL on discovering a new
+    in-link is a `ZADD` of the updated score, applied only if the depth and
+    in-link count it was computed from are still current. Depth and in-link counts
+    are kept in hashes so they are shared across crawler processes.
+
+    As with `PriorityScheduler`, ties are broken in discovery order. Sorted set
+    members with equal scores are ordered lexicographically, so each member is
+    the url prefixed by a fixed-width, descending discovery sequence number.
+    """
+    def __init__(self, connstr="redis://localhost", scorer=None):
+        super().__init__(connstr)
+        self.scorer = scorer if scorer is not None else UrlScorer()
+
+    async def setup(self):
+        await super().setup()
+        await self.redis.delete(
+            "priority-frontier", "depth", "inlinks", "discovery",
+            "discovery-counter")
+
+        # Returns the updated {depth, inlinks} for the url, or nil if it has
+        # already been seen (and therefore does not need scoring)
+        self.update_links_script_sha1 = await self.redis.script_load("""
+            local seen_key = KEYS[1]
+            local depth_key = KEYS[2]
+            local inlinks_key = KEYS[3]
+            local discovery_key = KEYS[4]
+            local discovery_counter_key = KEYS[5]
+            local url = ARGV[1]
+            local referrer = ARGV[2]
+            if redis.call('SISMEMBER', seen_key, url) == 1 then
+              return nil
+            end
+            if redis.call('HEXISTS', discovery_key, url) == 0 then
+              local seq = redis.call('INCR', discovery_counter_key)
+              redis.call('HSET', discovery_key, url, seq)
+            end
+            local depth = 0
+            local inlinks = tonumber(redis.call('HGET', inlinks_key, url) or 0)
+            if referrer ~= '' then
+              depth = tonumber(redis.call('HGET', depth_key, referrer) or 0) + 1
+              inlinks = redis.call('HINCRBY', inlinks_key, url, 1)
+            end
+            local old_depth = redis.call('HGET', depth_key, url)
+            if old_depth and tonumber(old_depth) < depth then
+              depth = tonumber(old_depth)
+            else
+              redis.call('HSET', depth_key, url, depth)
+            end
+            return {depth, inlinks}
+            """)
+
+        # Only adds the url with `score` if it was computed from the current
+        # {depth, inlinks}; otherwise returns those so the score is recomputed.
+        # This avoids a stale score from a concurrent worker overwriting a
+        # newer one.
+        self.add_url_script_sha1 = await self.redis.script_load("""
+            local frontier_key = KEYS[1]
+            local seen_key = KEYS[2]
+            local depth_key = KEYS[3]
+            local inlinks_key = KEYS[4]
+            local discovery_key = KEYS[5]
+            local url = ARGV[1]
+            local score = ARGV[2]
+            local depth = tonumber(redis.call('HGET', depth_key, url) or 0)
+            local inlinks = tonumber(redis.call('HGET', inlinks_key, url) or 0)
+            if depth ~= tonumber(ARGV[3]) or inlinks ~= tonumber(ARGV[4]) then
+              return {depth, inlinks}
+            end
+            if redis.call('SISMEMBER', seen_key, url) == 0 then
+              local seq = tonumber(redis.call('HGET', discovery_key, url))
+              local member = string.format('%015d', 999999999999999 - seq)
+              redis.call('ZADD', frontier_key, score, member .. url)
+            end
+            return nil
+            """)
+
+        self.get_url_script_sha1 = await self.redis.script_load("""
+            local frontier_key = KEYS[1]
+            local seen_key = KEYS[2]
+            local inlinks_key = KEYS[3]
+            local discovery_key = KEYS[4]
+            local member = redis.call('ZREVRANGE', frontier_key, 0, 0)[1]
+            if member then
+              redis.call('ZREM', frontier_key, member)
+              local url = string.sub(member, 16)
+              if redis.call('SISMEMBER', seen_key, url) == 0 then
+                redis.call('SADD', seen_key, url)
+                -- Only depth is still needed, to score the links on this page
+                redis.call('HDEL', inlinks_key, url)
+                redis.call('HDEL', discovery_key, url)
+                return url
+              else
+                return nil
+              end
+            else
+              return nil
+            end
+            """)
+
+    async def add_to_frontier(self, url, referrer=None):
+        encoded_url = url.encode("utf-8")
+        link_stats = await self.redis.evalsha(
+            self.update_links_script_sha1,
+            keys=["seen", "depth", "inlinks", "discovery",
+                  "discovery-counter"],
+            args=[encoded_url, (referrer or "").encode("utf-8")])
+        while link_stats is not None:
+            depth, inlinks = link_stats
+            score = self.scorer(url, depth, inlinks)
+            link_stats = await self.redis.evalsha(
+                self.add_url_script_sha1,
+                keys=["priority-frontier", "seen", "depth", "inlinks",
+                      "discovery"],
+                args=[encoded_url, score, depth, inlinks])
+
+    async def join(self):
+        # Poll for the frontier to be empty; see RedisScheduler.join
+        while True:
+            count_urls = await self.redis.zcard("priority-frontier")
+            if count_urls == 0:
+                return
+            await asyncio.sleep(1.0)
+
+    async def get(self):
+        while True:
+            encoded_url = await self.redis.evalsha(
+                self.get_url_script_sha1,
+                keys=["priority-frontier", "seen", "inlinks", "discovery"])
+            if encoded_url:
+                return encoded_url.decode("utf-8")
+
+    async def qsize(self):
+        return await self.redis.zcard("priority-frontier")
+
+    async def drain(self):
+        """Drain the frontier"""
+        await self.redis.delete("priority-frontier")
+
+
 class Crawler:
     """Crawls URLs using async tasks and an in-memory frontier queue"""
     
@@ -301,6 +566,10 @@ class Crawler:
         """Crawls the next url from the `frontier`, processing tags for the sitemap"""
         tag_parser = TagParser({"a", "img"})
 
+        # Pages often link the same target more than once (header and footer
+        # nav, pagination), but that is only one in-link for scheduling
+        frontier_urls = set()
+
         # TODO: support 301, error handling in general here
         async for chunk in fetch(session, url):
             for tag in self.process_sitemap_tags(url, tag_parser, chunk):
@@ -309,8 +578,10 @@ class Crawler:
                 # that they are all prefixed by one of the root sites
                 if tag.name == "a":
                     parsed_tag_url = urllib.parse.urlsplit(tag.url)
-                    if parsed_tag_url.netloc in self.sites:
-                        await self.scheduler.add_to_frontier(tag.url)
+                    if (parsed_tag_url.netloc in self.sites
+                            and tag.url not in frontier_urls):
+                        frontier_urls.add(tag.url)
+                        await self.scheduler.add_to_frontier(tag.url, url)
 
     def process_sitemap_tags(self, url, tag_parser, chunk):
         """Yields sitemap tags and added to `frontier` if under `roots`"""
@@ -330,6 +601,18 @@ class Crawler:
                 yield tag
 
 
+def parse_pattern_weight(value):
+    """Parse a `REGEX=WEIGHT` command line value into a (regex, weight) pair"""
+    pattern, sep, weight = value.rpartition("=")
+    try:
+        if not sep or not pattern:
+            raise ValueError(value)
+        return pattern, float(weight)
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f"expected REGEX=WEIGHT, got {value!r}")
+
+
 def parse_args(argv):
     """Parse command line arguments and return an argparse `Namespace`"""
     parser = argparse.ArgumentParser(
@@ -340,6 +623,14 @@ def parse_args(argv):
     parser.add_argument(
         "--redis", metavar="CONNSTR",
         help="Use Redis with specified connection string (ex: redis://localhost)")
+    parser.add_argument(
+        "--priority", action="store_true",
+        help="Crawl best-first by URL score instead of in FIFO order")
+    parser.add_argument(
+        "--pattern-weight", metavar="REGEX=WEIGHT", action="append",
+        type=parse_pattern_weight, default=[],
+        help="With --priority, add WEIGHT to the score of URLs matching REGEX "
+             "(repeatable)")
     parser.add_argument(
         "--num-workers", type=int, default=3,
         help="Number of workers to concurrently crawl pages")
@@ -372,8 +663,13 @@ async def main(argv):
         # tailable
         yaml.dump(objs, sys.stdout)
 
-    if args.redis:
+    scorer = UrlScorer(pattern_weights=dict(args.pattern_weight))
+    if args.redis and args.priority:
+        scheduler = RedisPriorityScheduler(args.redis, scorer)
+    elif args.redis:
         scheduler = RedisScheduler(args.redis)
+    elif args.priority:
+        scheduler = PriorityScheduler(scorer)
     else:
         scheduler = SimpleScheduler()
     async with scheduler as open_scheduler:
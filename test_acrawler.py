@@ -122,7 +122,9 @@ reference_loop_html = """
 # scope, to avoid the overhead of spinning up/down a Redis instance with
 # Docker (once we implement that). But first see if that's a real cost.
 
-@pytest.fixture(params=[acrawler.SimpleScheduler, acrawler.RedisScheduler])
+@pytest.fixture(params=[
+    acrawler.SimpleScheduler, acrawler.RedisScheduler,
+    acrawler.PriorityScheduler, acrawler.RedisPriorityScheduler])
 async def scheduler(request, event_loop):
     my_scheduler = request.param()
     yield my_scheduler
@@ -153,6 +155,147 @@ async def test_scheduler(scheduler):
     await scheduler.join()
 
 
+priority_schedulers = [
+    acrawler.PriorityScheduler, acrawler.RedisPriorityScheduler]
+
+
+@pytest.mark.parametrize("scheduler", priority_schedulers, indirect=True)
+@pytest.mark.asyncio
+async def test_priority_scheduler(scheduler):
+    await scheduler.setup()
+
+    await scheduler.add_to_frontier("https://some.example")
+    assert await scheduler.get() == "https://some.example"
+    scheduler.task_done()
+
+    await scheduler.add_to_frontier(
+        "https://some.example/calendar?year=2020&month=1",
+        "https://some.example")
+    await scheduler.add_to_frontier(
+        "https://some.example/a", "https://some.example")
+    await scheduler.add_to_frontier(
+        "https://some.example/b", "https://some.example")
+    # Discovering another in-link rescores an existing entry
+    await scheduler.add_to_frontier(
+        "https://some.example/b", "https://some.example/a")
+    # Seen URLs are not added back to the frontier
+    await scheduler.add_to_frontier(
+        "https://some.example", "https://some.example/a")
+    assert await scheduler.qsize() == 3
+
+    crawled = []
+    for i in range(3):
+        crawled.append(await scheduler.get())
+        scheduler.task_done()
+    assert crawled == [
+        "https://some.example/b",
+        "https://some.example/a",
+        "https://some.example/calendar?year=2020&month=1",
+    ]
+    assert await scheduler.qsize() == 0
+    assert await scheduler.count() == 4
+
+    await scheduler.join()
+
+
+@pytest.mark.parametrize("scheduler", priority_schedulers, indirect=True)
+@pytest.mark.asyncio
+async def test_priority_scheduler_ties(scheduler):
+    await scheduler.setup()
+
+    await scheduler.add_to_frontier("https://some.example")
+    assert await scheduler.get() == "https://some.example"
+    scheduler.task_done()
+
+    # Equal scores are crawled in discovery order, including after rescoring
+    await scheduler.add_to_frontier(
+        "https://some.example/z", "https://some.example")
+    await scheduler.add_to_frontier(
+        "https://some.example/a", "https://some.example")
+    await scheduler.add_to_frontier(
+        "https://some.example/a", "https://some.example/b")
+    await scheduler.add_to_frontier(
+        "https://some.example/z", "https://some.example/b")
+
+    crawled = []
+    for i in range(2):
+        crawled.append(await scheduler.get())
+        scheduler.task_done()
+    assert crawled == ["https://some.example/z", "https://some.example/a"]
+
+    await scheduler.join()
+
+
+@pytest.mark.parametrize("scheduler", priority_schedulers, indirect=True)
+@pytest.mark.asyncio
+async def test_priority_scheduler_shallower_depth(scheduler):
+    await scheduler.setup()
+
+    async def crawl(*urls):
+        for url in urls:
+            assert await scheduler.get() == url
+            scheduler.task_done()
+
+    await scheduler.add_to_frontier("https://some.example")
+    await scheduler.add_to_frontier("https://some.example/home")
+    await crawl("https://some.example", "https://some.example/home")
+    await scheduler.add_to_frontier(
+        "https://some.example/p", "https://some.example")
+    await scheduler.add_to_frontier(
+        "https://some.example/q", "https://some.example")
+    await crawl("https://some.example/p", "https://some.example/q")
+
+    # Concurrent in-links to the same URL race on its score; the newest score
+    # must win
+    await asyncio.gather(
+        scheduler.add_to_frontier(
+            "https://some.example/x", "https://some.example/p"),
+        scheduler.add_to_frontier(
+            "https://some.example/x", "https://some.example/q"))
+    await scheduler.add_to_frontier(
+        "https://some.example/y", "https://some.example/p")
+    # First found at depth 2, now also linked from a depth 0 page
+    await scheduler.add_to_frontier(
+        "https://some.example/y", "https://some.example/home")
+    assert await scheduler.qsize() == 2
+
+    # Both have two in-links, but /y is now shallower, despite being
+    # discovered after /x
+    await crawl("https://some.example/y", "https://some.example/x")
+    await scheduler.join()
+
+
+@pytest.mark.asyncio
+async def test_priority_scheduler_compaction():
+    scheduler = acrawler.PriorityScheduler()
+    await scheduler.add_to_frontier("https://some.example")
+    assert await scheduler.get() == "https://some.example"
+    scheduler.task_done()
+
+    await scheduler.add_to_frontier(
+        "https://some.example/a", "https://some.example")
+    for i in range(100):
+        await scheduler.add_to_frontier(
+            "https://some.example/nav", f"https://some.example/page/{i}")
+    assert await scheduler.qsize() == 2
+    assert scheduler.frontier.qsize() <= 2 * scheduler.compaction_ratio
+
+    assert await scheduler.get() == "https://some.example/nav"
+    scheduler.task_done()
+    assert await scheduler.get() == "https://some.example/a"
+    scheduler.task_done()
+    await scheduler.join()
+
+
+def test_url_scorer():
+    scorer = acrawler.UrlScorer(pattern_weights={r"/blog/": 2.0})
+    assert scorer("https://some.example", 0, 0) == 0.0
+    assert scorer("https://some.example/a", 1, 0) == -1.0
+    assert scorer("https://some.example/a?x=1&y=2", 1, 0) == -2.0
+    assert scorer("https://some.example/blog/post", 1, 0) == 1.0
+    assert scorer("https://some.example/a", 1, 3) == math.log1p(3) - 1.0
+
+
 @pytest.mark.asyncio
 async def test_crawler(scheduler):
     fake_session_maker = functools.partial(
@@ -204,6 +347,39 @@ misc_tags_html = """
 </body>
 """
 
+duplicate_links_html = """
+<body>
+    <p><a href="https://this.example/a">Header nav</a></p>
+    <p><a href="https://this.example/b">Click for a page</a></p>
+    <p><a href="https://this.example/a">Footer nav</a></p>
+</body>
+"""
+
+@pytest.mark.asyncio
+async def test_crawl_next_distinct_links():
+    added = []
+
+    class FakeScheduler:
+        def add_to_frontier(self, url, referrer=None):
+            added.append((url, referrer))
+            return acrawler.make_future_result(None)
+
+    crawler = acrawler.Crawler(FakeScheduler(), None, None)
+    crawler.sites.add("this.example")
+    session = make_fake_http_session(bytes(duplicate_links_html, "utf-8"))
+    tags = []
+    async for tag in crawler.crawl_next(session, "https://this.example"):
+        tags.append(tag)
+
+    # Every tag is part of the sitemap, but each target is only passed to the
+    # scheduler once per page, so in-links are counted per referring page
+    assert len(tags) == 3
+    assert added == [
+        ("https://this.example/a", "https://this.example"),
+        ("https://this.example/b", "https://this.example"),
+    ]
+
+
 def test_process_sitemap_tags():
     crawler = acrawler.Crawler(None, None, None)
     tag_parser = acrawler.TagParser({"a", "img"})
@@ -241,6 +417,17 @@ def test_parse_command_line_all_pages():
     assert args.all
 
 
+def test_parse_command_line_pattern_weights():
+    args = acrawler.parse_args(
+        "--priority --pattern-weight=/blog/=2 "
+        "--pattern-weight=[?&]page=\\d+=-1.5 https://example.com".split())
+    assert args.priority
+    assert args.pattern_weight == [("/blog/", 2.0), (r"[?&]page=\d+", -1.5)]
+
+    with pytest.raises(SystemExit):
+        acrawler.parse_args("--pattern-weight=/blog/ https://example.com".split())
+
+
 def test_resolve_url():
     assert acrawler.resolve_url(
         "https://example.com", "https://www.iana.org/domains/example") == \
@@ -261,7 +448,15 @@ def SimpleSchedulerOption():
 def RedisSchedulerOption():
     return ["--redis=redis://localhost"]
 
-@pytest.fixture(params=[SimpleSchedulerOption, RedisSchedulerOption])
+def PrioritySchedulerOption():
+    return ["--priority"]
+
+def RedisPrioritySchedulerOption():
+    return ["--priority", "--redis=redis://localhost"]
+
+@pytest.fixture(params=[
+    SimpleSchedulerOption, RedisSchedulerOption,
+    PrioritySchedulerOption, RedisPrioritySchedulerOption])
 def command_options(request):
     return request.param()
 